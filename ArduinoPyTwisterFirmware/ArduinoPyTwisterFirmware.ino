@@ -11,17 +11,20 @@
 */
 
 const char FIRMWARE_NAME[] = "ArduinoPyTwister";
-const char VERSION[] = "0.1";
+const char VERSION[] = "0.4";
 
 /* Acceptable instruction codes */
 const String RESET_CODE = "RES";
 const String FIRMWARE_CODE = "FIR";
 const String VERSION_CODE = "VER";
 const unsigned char TURN_CODE_PREFIX = 'T';
+const unsigned char BATCH_CODE_PREFIX = 'B';
 
 /* Error and Acknowledgement codes (single byte) */
 const unsigned char ACK = 0;
 const unsigned char ERR = 1;
+/* Sent once when initialization is complete */
+const unsigned char READY = 'R';
 
 /* How Sparkfun Easy Driver stepper motor driver
 connectors are connected to Arduino */
@@ -33,6 +36,11 @@ const unsigned short PIN_STEP = 4;
 const unsigned short stepDelayMs = 2; //ms
 /* How long to wait after rotation is complete */
 const unsigned short stopDelayMs = 200; //ms
+/* Largest number of rotations in a batch command, so that the whole
+command fits in the 64-byte receive buffer */
+const uint16_t MAX_BATCH_SIZE = 30;
+/* How long to wait for the next step count of a batch command */
+const unsigned long batchTimeoutMs = 1000; //ms
 
 void reset()
 { /*  Reset Easy Driver pins to default states */
@@ -50,13 +58,16 @@ void setup()
   reset();
   //Serial.begin(19200);
   Serial.begin(9600);
+  Serial.write(READY);
 }
 
 void loop()
 { /* This function loops over to accept instructions over the serial port
   Properly formatted commands are three characters long. If the first
   character is TURN_CODE_PREFIX the last two characters are interpreted as
-  the number of steps and rotation direction direction.
+  the number of steps and rotation direction direction. If the first
+  character is BATCH_CODE_PREFIX the last two characters are interpreted as
+  the number of rotations that follow, each sent as two characters.
   */
   char received_command[3];
   if (Serial.available() >= 3)
@@ -75,10 +86,10 @@ void loop()
     }else if (String(received_command)==FIRMWARE_CODE){
       /* Return the firmware name */
       //Serial.println("Firmware");
-      Serial.println(FIRMWARE_NAME);
+      send_reply(FIRMWARE_NAME);
     } else if(String(received_command)==VERSION_CODE){
       /* Return the firmare version number */
-      Serial.println(VERSION);
+      send_reply(VERSION);
     } else if (received_command[0]==TURN_CODE_PREFIX){
       /* Rotate the twister */
       int16_t steps = rotation_code_to_int16(received_command);
@@ -89,6 +100,31 @@ void loop()
       DEBUG */
       rotate_by_steps(steps);
       Serial.write(ACK);
+    } else if (received_command[0]==BATCH_CODE_PREFIX){
+      /* Rotate the twister successively by each of the following
+         step counts, acknowledging each rotation */
+      uint16_t count = (uint16_t)rotation_code_to_int16(received_command);
+      if (count > MAX_BATCH_SIZE)
+      {
+        Serial.write(ERR);
+        return;
+      }
+      for (uint16_t i = 0; i < count; i++)
+      {
+        unsigned long waitStartMs = millis();
+        while (Serial.available() < 2)
+        { /* Wait for the next step count, giving up on truncated commands */
+          if (millis() - waitStartMs > batchTimeoutMs)
+          {
+            Serial.write(ERR);
+            return;
+          }
+        }
+        received_command[1] = Serial.read();
+        received_command[2] = Serial.read();
+        rotate_by_steps(rotation_code_to_int16(received_command));
+        Serial.write(ACK);
+      }
     }else{
       /* The command is unrecognized. */
       //Serial.write(ERR);
@@ -100,6 +136,14 @@ void loop()
   }
 }
 
+void send_reply(const char* message)
+{ /* Send a text reply as one byte holding its length
+  followed by the characters of the message */
+  uint8_t length = strlen(message);
+  Serial.write(length);
+  Serial.write((const uint8_t*)message, length);
+}
+
 int16_t rotation_code_to_int16(char* rotation_command ){
 /*
 Extract the last two bytes of a 3-byte rotation command
@@ -9,39 +9,115 @@ A set of functions to interact with an Arduino
 and a Sparkfun stepper motor driver.
 """
 
+import logging
+import re
+import struct
+import threading
 import time
-from typing import Optional
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Tuple, Union
 import serial
 import serial.tools.list_ports
 from packaging import version
 
 # Arduino Firmware Requirements
 REQUIRED_FIRMWARE_NAME = "ArduinoPyTwister"
-MINIMUM_FIRMWARE_VERSION = "0.1"
+MINIMUM_FIRMWARE_VERSION = "0.3"
 # Arduino Instruction Codes
 RESET_CODE = "RES"
 FIRMWARE_CODE = "FIR"
 VERSION_CODE = "VER"
 TURN_CODE_PREFIX = "T"
+BATCH_CODE_PREFIX = "B"
+# Arduino Status Codes
+READY_CODE = "R"  # sent once initialization is complete
+# Instruction codes as sent over the serial port
+FIRMWARE_CODE_B = FIRMWARE_CODE.encode("utf-8")
+VERSION_CODE_B = VERSION_CODE.encode("utf-8")
+IDENTITY_CODE_B = FIRMWARE_CODE_B + VERSION_CODE_B
+TURN_CODE_PREFIX_B = TURN_CODE_PREFIX.encode("utf-8")
+BATCH_CODE_PREFIX_B = BATCH_CODE_PREFIX.encode("utf-8")
+READY_CODE_B = READY_CODE.encode("utf-8")
+# Rotation command: turn code followed by steps as a little-endian int16
+_ROT_STRUCT = struct.Struct("<ch")
+ROTATE_COMMAND_SIZE = _ROT_STRUCT.size  # bytes
 # Arduino and Motor Driver Parameters
 STEP_SIZE = 0.225  # degrees
 ACK = 0  # successful completion
 ERR = 1  # error
+# Largest number of rotations in a batch command, so that
+# the whole command fits in the Arduino 64-byte receive buffer
+MAX_BATCH_SIZE = 30
+# Time the Arduino spends on each step and after each rotation
+# (twice stepDelayMs and stopDelayMs in the firmware)
+STEP_DURATION = 0.004  # seconds
+STOP_DURATION = 0.2  # seconds
 # Delays
-# How long to wait for Arduino to finish initializing
+# How long to wait at most for Arduino to finish initializing
 INITIALIZE_DELAY = 2  # seconds
 # how long to wait before time out when reading
 # from serial port
 TIME_OUT = 5  # seconds
+# how long to wait before time out when writing
+# to serial port
+WRITE_TIME_OUT = 0.5  # seconds
+# how long to wait for any probed port to be
+# identified as an ArduinoPyTwister
+PORT_DISCOVERY_TIMEOUT = 10  # seconds
+# how long an enumeration of the COM ports is reused
+COMPORT_LIST_MAX_AGE = 2  # seconds
 
+logger = logging.getLogger(__name__)
 
-def get_comport_list() -> Optional[list]:
+
+class BatchRotationError(RuntimeError):
+    """
+    Raised when the rotations of a batch are not all acknowledged,
+    `acknowledged` being the number of leading rotations that the
+    Arduino did complete and `status_codes` the status codes received.
+    """
+
+    def __init__(self, message: str, acknowledged: int, status_codes: list):
+        super().__init__(message)
+        self.acknowledged = acknowledged
+        self.status_codes = status_codes
+
+
+# Parsed once and shared by all probes
+_MINIMUM_FIRMWARE_VERSION = version.parse(MINIMUM_FIRMWARE_VERSION)
+
+# Last COM port enumeration, as a (time.monotonic() timestamp, list) pair
+_comport_cache = None
+# Substrings found in the port descriptions of Arduino boards and clones
+_ARDUINO_HINTS = ("Arduino", "CH340", "CH341", "USB Serial", "FT232")
+_ARDUINO_DESCRIPTION_SEARCH = re.compile(
+    "|".join(re.escape(hint) for hint in _ARDUINO_HINTS), re.IGNORECASE
+).search
+# (vendor id, product id) of USB chips found on Arduino boards and clones,
+# a product id of None matching any product of the vendor
+_ARDUINO_VIDPIDS = {
+    (0x2341, None),  # Arduino
+    (0x2A03, None),  # Arduino (arduino.org)
+    (0x1A86, 0x7523),  # CH340
+    (0x1A86, 0x5523),  # CH341
+    (0x0403, 0x6001),  # FT232R
+}
+
+
+def get_comport_list(max_age: float = COMPORT_LIST_MAX_AGE) -> Optional[list]:
     """
     Returns a list of all available COM ports
     ListPortInfo objects or None if none is found.
     Wrapper around serial.tools.list_ports.comports.
+    The enumeration is reused for `max_age` seconds;
+    set it to 0 to force a new enumeration.
     """
-    com_port_list = serial.tools.list_ports.comports()
+    global _comport_cache
+    now = time.monotonic()
+    if _comport_cache is None or now - _comport_cache[0] >= max_age:
+        _comport_cache = (now, serial.tools.list_ports.comports())
+    com_port_list = list(_comport_cache[1])
     if len(com_port_list) == 0:
         com_port_list = None
     return com_port_list
@@ -50,10 +126,20 @@ def get_comport_list() -> Optional[list]:
 def get_arduino_ports(com_port_list: list) -> Optional[list]:
     """
     Probe serial com ports provided in list
-    com_port_list and return a list of those containing
-    `Arduino` in their description or None if none found.
+    com_port_list and return a list of those whose USB
+    vendor and product ids are those of an Arduino
+    board or clone, followed by those with `Arduino`
+    or a known USB-serial chip in their description,
+    or None if none found.
     """
-    arduino_ports = [p.device for p in com_port_list if "Arduino" in p.description]
+    usb_id_matches = []
+    description_matches = []
+    for p in com_port_list:
+        if (p.vid, p.pid) in _ARDUINO_VIDPIDS or (p.vid, None) in _ARDUINO_VIDPIDS:
+            usb_id_matches.append(p.device)
+        elif _ARDUINO_DESCRIPTION_SEARCH(p.description):
+            description_matches.append(p.device)
+    arduino_ports = usb_id_matches + description_matches
     if len(arduino_ports) == 0:
         return None
     return arduino_ports
@@ -67,16 +153,9 @@ def get_arduino_firmware_name(ser) -> str:
     connection is done via the provided Serial
     object ser.
     """
-    msg_b = bytes(FIRMWARE_CODE, "utf-8")
-    print(f"Sending message >{msg_b.decode('utf-8')}<...")
-    ser.write(msg_b)
-    arduino_msg = ser.readline().decode("utf-8").rstrip()
-    if arduino_msg != "":
-        print(f"Arduino replied >{arduino_msg}<...")
-        firmware_name = arduino_msg
-    else:
-        firmware_name = "No Arduino firmware name could be retrieved."
-    return firmware_name
+    logger.debug("Sending message >%s<...", FIRMWARE_CODE)
+    ser.write(FIRMWARE_CODE_B)
+    return read_arduino_reply(ser, "No Arduino firmware name could be retrieved.")
 
 
 def get_arduino_firmware_version(ser) -> str:
@@ -87,52 +166,211 @@ def get_arduino_firmware_version(ser) -> str:
     connection is done via the provided Serial
     object ser.
     """
-    msg_b = bytes(VERSION_CODE, "utf-8")
-    print(f"Sending message >{msg_b.decode('utf-8')}<...")
-    ser.write(msg_b)
-    arduino_msg = ser.readline().decode("utf-8").rstrip()
-    if arduino_msg != "":
-        print(f"Arduino replied >{arduino_msg}<...")
-        firmware_version = arduino_msg
-    else:
-        firmware_version = "No Arduino firmware version could be retrieved."
-    return firmware_version
+    logger.debug("Sending message >%s<...", VERSION_CODE)
+    ser.write(VERSION_CODE_B)
+    return read_arduino_reply(ser, "No Arduino firmware version could be retrieved.")
+
+
+def get_arduino_identity(ser) -> Tuple[str, str]:
+    """
+    Returns firmware name and version (as strings,
+    or messages if they could not be retrieved) of
+    an Arduino which was already initialized and to
+    which connection is done via the provided Serial
+    object ser.
+    Both requests are sent in a single write, the
+    Arduino processing them one after the other, so
+    that the identity costs a single round-trip.
+    """
+    logger.debug("Sending message >%s%s<...", FIRMWARE_CODE, VERSION_CODE)
+    ser.write(IDENTITY_CODE_B)
+    firmware_name = read_arduino_reply(
+        ser, "No Arduino firmware name could be retrieved."
+    )
+    firmware_version = read_arduino_reply(
+        ser, "No Arduino firmware version could be retrieved."
+    )
+    return firmware_name, firmware_version
 
 
-def get_serial_object_to_arduino(arduino_port):
+def read_arduino_reply(ser, default_reply: str) -> str:
+    """
+    Read a reply sent by the Arduino connected via
+    the Serial object ser and return it (as a string)
+    or `default_reply` if nothing was received
+    before the time out.
+    A reply consists of one byte holding the length
+    of the message followed by the message itself.
+    """
+    length = ser.read(1)
+    if len(length) == 0:
+        return default_reply
+    arduino_msg = ser.read(length[0]).decode("utf-8", errors="replace")
+    if arduino_msg == "":
+        return default_reply
+    logger.debug("Arduino replied >%s<...", arduino_msg)
+    return arduino_msg
+
+
+def get_serial_object_to_arduino(arduino_port, low_latency: bool = True):
     """
     Open and initialize Arduino, return handle to
     Serial object that allows communicating with
     the Arduino.
+    If `low_latency` is True, the ASYNC_LOW_LATENCY flag
+    is requested on the port so that short replies are not
+    held back by the USB-serial latency timer; ports that
+    do not support it are used as they are.
+    The Arduino signals the end of its initialization
+    by sending READY_CODE; other bytes received meanwhile
+    are discarded, and firmware that does not send it is
+    given INITIALIZE_DELAY seconds (from the opening of
+    the port) instead.
     """
-    ser = serial.Serial(arduino_port, timeout=TIME_OUT)
+    ser = serial.Serial(
+        arduino_port, timeout=INITIALIZE_DELAY, write_timeout=WRITE_TIME_OUT
+    )
+    deadline = time.monotonic() + INITIALIZE_DELAY
+    if low_latency:
+        set_low_latency_mode(ser)
     ser.reset_input_buffer()
-    print(f"Giving the Arduino {INITIALIZE_DELAY} seconds to intialize...")
-    time.sleep(INITIALIZE_DELAY)
-    print("The wait is over, returning Serial Object.")
+    logger.debug(
+        "Giving the Arduino up to %s seconds to intialize...", INITIALIZE_DELAY
+    )
+    ready = False
+    remaining = deadline - time.monotonic()
+    while not ready and remaining > 0:
+        ser.timeout = remaining
+        ready = ser.read(1) == READY_CODE_B
+        remaining = deadline - time.monotonic()
+    if ready:
+        logger.debug("The Arduino reported it is ready, returning Serial Object.")
+    else:
+        logger.debug(
+            "The Arduino did not report it is ready within %s seconds,"
+            + " returning Serial Object.",
+            INITIALIZE_DELAY,
+        )
+    ser.timeout = TIME_OUT
     return ser
 
 
-def scan_list_for_arduinopytwister(arduino_ports: list):
+def set_low_latency_mode(ser) -> bool:
+    """
+    Try to enable the ASYNC_LOW_LATENCY flag on the
+    Serial object ser (Linux only). Returns True on
+    success, False if the platform or the USB-serial
+    driver does not support it.
+    """
+    try:
+        ser.set_low_latency_mode(True)
+    except (AttributeError, NotImplementedError, ValueError, OSError) as exc:
+        logger.debug("Low latency mode not available: %s", exc)
+        return False
+    return True
+
+
+def scan_list_for_arduinopytwister(arduino_ports: list, low_latency: bool = True):
     """
     Scan a list of ports, open each to check
     if they are arduinotwister objects, then close them.
     If firmware and version requirements are met,
     return the port, return None otherwise.
+    Ports are probed concurrently (one thread per port)
+    so that the initialization delay and read time-outs
+    are paid once rather than once per port. Ports that
+    are not identified within PORT_DISCOVERY_TIMEOUT
+    seconds are skipped.
+    `low_latency` is passed on to get_serial_object_to_arduino
+    when opening each port.
     Note: all tested ports (including the port that is
-    returned, if found) are closed.
+    returned, if found) are closed. Probes still running
+    when the scan ends are interrupted and close their
+    port in the background.
     """
     arduino_twister_port = None
-    for port_to_check in arduino_ports:
-        ser = get_serial_object_to_arduino(port_to_check)
-        if check_arduino_is_twister_arduino(ser):
-            arduino_twister_port = port_to_check
-            ser.close()
-            break
-        ser.close()
+    if len(arduino_ports) == 0:
+        return arduino_twister_port
+    probing = {}
+    lock = threading.Lock()
+    scan_over = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=len(arduino_ports))
+    futures = [
+        executor.submit(
+            _probe_port, port_to_check, probing, lock, scan_over, low_latency
+        )
+        for port_to_check in arduino_ports
+    ]
+    try:
+        for future in as_completed(futures, timeout=PORT_DISCOVERY_TIMEOUT):
+            port_to_check, is_twister = future.result()
+            if is_twister:
+                arduino_twister_port = port_to_check
+                break
+    except concurrent.futures.TimeoutError:
+        logger.warning(
+            "No ArduinoPyTwister identified within %s seconds.", PORT_DISCOVERY_TIMEOUT
+        )
+    finally:
+        for future in futures:
+            future.cancel()
+        with lock:
+            scan_over.set()
+            for ser in probing.values():
+                _interrupt_probe(ser)
+        # Interrupted probes close their port concurrently, in their own thread
+        executor.shutdown(wait=False)
     return arduino_twister_port
 
 
+def _probe_port(
+    port_to_check: str, probing: dict, lock, scan_over, low_latency: bool = True
+) -> Tuple[str, bool]:
+    """
+    Open the port `port_to_check`, check whether an
+    ArduinoPyTwister is connected to it and close it.
+    Returns the port along with the outcome of the check,
+    ports that cannot be opened, written to or read from
+    being reported as not connected to an ArduinoPyTwister.
+    While it is checked, the Serial object is registered
+    in the `probing` dictionary (guarded by `lock`) so that
+    the scan can interrupt it once `scan_over` is set.
+    The port is opened in low latency mode if `low_latency` is True.
+    """
+    try:
+        ser = get_serial_object_to_arduino(port_to_check, low_latency=low_latency)
+    except serial.SerialException as exc:
+        logger.info("Could not open port %s: %s", port_to_check, exc)
+        return port_to_check, False
+    try:
+        with lock:
+            if scan_over.is_set():
+                return port_to_check, False
+            probing[port_to_check] = ser
+        return port_to_check, check_arduino_is_twister_arduino(ser)
+    except serial.SerialException as exc:
+        logger.info("Could not communicate with port %s: %s", port_to_check, exc)
+        return port_to_check, False
+    finally:
+        with lock:
+            probing.pop(port_to_check, None)
+        ser.close()
+
+
+def _interrupt_probe(ser) -> None:
+    """
+    Make pending and further reads on the Serial
+    object ser return immediately, so that a probe
+    that is no longer needed ends and closes its port
+    without waiting for its read time-outs.
+    """
+    try:
+        ser.timeout = 0
+        ser.cancel_read()
+    except (AttributeError, serial.SerialException) as exc:
+        logger.debug("Could not interrupt probe on %s: %s", ser.port, exc)
+
+
 def check_arduino_is_twister_arduino(ser) -> bool:
     """
     Check whether Arduino linked to Serial object
@@ -141,30 +379,41 @@ def check_arduino_is_twister_arduino(ser) -> bool:
     met, False otherwise.
     """
     requirements_met = False
-    firmware_name = get_arduino_firmware_name(ser)
+    firmware_name, firmware_version = get_arduino_identity(ser)
     if firmware_name == REQUIRED_FIRMWARE_NAME:
-        print(f"Correct Arduino detected, firmware is: {firmware_name} ")
-        firmware_version = get_arduino_firmware_version(ser)
-        print(f"Arduino replied: >{firmware_version}<.")
-        if version.parse(MINIMUM_FIRMWARE_VERSION) <= version.parse(firmware_version):
-            print(
-                (
-                    "Correct Arduino firmware and version"
-                    + f" >{firmware_name}< version >{firmware_version}<."
-                )
+        logger.debug("Correct Arduino detected, firmware is: %s ", firmware_name)
+        logger.debug("Arduino replied: >%s<.", firmware_version)
+        if is_firmware_version_supported(firmware_version):
+            logger.info(
+                "Correct Arduino firmware and version >%s< version >%s<.",
+                firmware_name,
+                firmware_version,
             )
             requirements_met = True
         else:
-            print(
-                (
-                    "Incorrect Arduino firmware and version"
-                    + f" >{firmware_name}< version >{firmware_version}<."
-                )
+            logger.info(
+                "Incorrect Arduino firmware and version >%s< version >%s<.",
+                firmware_name,
+                firmware_version,
             )
     return requirements_met
 
 
-def rotate_by_steps(ser, steps: int):
+def is_firmware_version_supported(firmware_version: str) -> bool:
+    """
+    Returns True if `firmware_version` is a valid
+    version number, at least MINIMUM_FIRMWARE_VERSION,
+    False otherwise.
+    """
+    try:
+        return _MINIMUM_FIRMWARE_VERSION <= version.parse(firmware_version)
+    except version.InvalidVersion:
+        return False
+
+
+def rotate_by_steps(
+    ser, steps: int, command_buffer: Optional[bytearray] = None
+) -> Optional[int]:
     """
     Tell stepper motor on serial port `ser`
     to rotate by `steps` times 0.225° degrees.
@@ -183,36 +432,137 @@ def rotate_by_steps(ser, steps: int):
       200   45°              4          8
       400   90°              2          4
       800  180°              1          2
+
+    Returns the status code sent back by the Arduino
+    (ACK or ERR) or None if none was received before
+    the time out.
+    The command is assembled in `command_buffer` if
+    provided (see assemble_rotate_command), which lets
+    callers issuing many rotations reuse a single buffer.
     """
 
-    ser.write(assemble_rotate_command(steps))
+    ser.write(assemble_rotate_command(steps, command_buffer))
     status_code_bytes = ser.read(1)
-    status_code = int.from_bytes(status_code_bytes, byteorder="little")
-    print(f"status code is >{status_code}<.")
+    status_code = status_code_bytes[0] if status_code_bytes else None
+    logger.debug("status code is >%s<.", status_code)
+    return status_code
 
 
-def assemble_rotate_command(steps: int) -> bytes:
+def assemble_rotate_command(
+    steps: int, command_buffer: Optional[bytearray] = None
+) -> Union[bytes, bytearray]:
     """assemble a rotation command that consists of three bytes
     first byte contains the rotation character TURN_CODE_PREFIX
     second and third bytes contain the signed
     integer number of steps.
+    If a `command_buffer` of ROTATE_COMMAND_SIZE bytes
+    is provided, the command is written into it and
+    the buffer is returned instead of a new object.
     """
 
-    if not -32768 <= steps <= 32767:
+    try:
+        if command_buffer is None:
+            return _ROT_STRUCT.pack(TURN_CODE_PREFIX_B, steps)
+        _ROT_STRUCT.pack_into(command_buffer, 0, TURN_CODE_PREFIX_B, steps)
+        return command_buffer
+    except struct.error as exc:
         raise ValueError(
             f"Steps is too big: got {steps} but shoud be in [-32768, 32767]"
+        ) from exc
+
+
+def rotate_by_steps_batch(ser, steps_list: list) -> list:
+    """
+    Tell stepper motor on serial port `ser`
+    to rotate successively by each number of steps
+    in `steps_list` (see rotate_by_steps).
+    Rotations are sent in commands of at most
+    MAX_BATCH_SIZE rotations, each command being
+    written at once and acknowledged by the Arduino
+    with one status code per rotation.
+    Returns the list of status codes sent back by the
+    Arduino. Raises a BatchRotationError, telling how
+    many rotations were completed, if a rotation is not
+    acknowledged in time or is answered with ERR.
+    """
+
+    status_codes = []
+    for start in range(0, len(steps_list), MAX_BATCH_SIZE):
+        batch = steps_list[start : start + MAX_BATCH_SIZE]
+        ser.write(assemble_batch_rotate_command(batch))
+        duration = sum(abs(steps) for steps in batch) * STEP_DURATION
+        duration += len(batch) * STOP_DURATION
+        batch_status_codes = read_status_codes(
+            ser, len(batch), time.monotonic() + duration + TIME_OUT
         )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("status codes are >%s<.", list(batch_status_codes))
+        acknowledged = len(status_codes)
+        for status_code in batch_status_codes:
+            if status_code != ACK:
+                break
+            acknowledged += 1
+        status_codes.extend(batch_status_codes)
+        if len(batch_status_codes) < len(batch):
+            raise BatchRotationError(
+                f"Arduino acknowledged {acknowledged} of"
+                + f" {len(steps_list)} rotations before the time out.",
+                acknowledged,
+                status_codes,
+            )
+        if acknowledged < len(status_codes):
+            raise BatchRotationError(
+                f"Arduino reported an error: >{status_codes}<.",
+                acknowledged,
+                status_codes,
+            )
+    return status_codes
+
+
+def read_status_codes(ser, count: int, deadline: float) -> bytes:
+    """
+    Read `count` status codes sent by the Arduino
+    connected via the Serial object ser, waiting for
+    them until the time.monotonic() `deadline` has
+    passed rather than for a single read time out.
+    At least one read is made, even if the deadline
+    has already passed. Returns the status codes
+    received, which are fewer than `count` if the
+    deadline was reached.
+    """
+    status_codes = bytearray(ser.read(count))
+    while len(status_codes) < count and time.monotonic() < deadline:
+        status_codes += ser.read(count - len(status_codes))
+    return bytes(status_codes)
 
-    turn_code_as_byte = bytearray(bytes(TURN_CODE_PREFIX, "utf-8"))
-    steps_as_two_bytes = bytearray(steps.to_bytes(2, "little", signed=True))
-    rotate_command = b"".join([turn_code_as_byte, steps_as_two_bytes])
-    return rotate_command
+
+def assemble_batch_rotate_command(steps_list: list) -> bytes:
+    """assemble a batch rotation command that consists of
+    a first byte containing the batch character BATCH_CODE_PREFIX,
+    two bytes containing the unsigned number of rotations
+    and two bytes per rotation containing the signed integer
+    number of steps.
+    """
+
+    count = len(steps_list)
+    if not 0 < count <= MAX_BATCH_SIZE:
+        raise ValueError(
+            f"Batch size is invalid: got {count} but should be in [1, {MAX_BATCH_SIZE}]"
+        )
+
+    try:
+        return struct.pack(f"<cH{count}h", BATCH_CODE_PREFIX_B, count, *steps_list)
+    except struct.error as exc:
+        raise ValueError(
+            f"Steps is too big: got {steps_list} but shoud be in [-32768, 32767]"
+        ) from exc
 
 
 def main() -> None:
     """
     Demo arduino_twister
     """
+    logging.basicConfig(level=logging.DEBUG)
     port_list = get_comport_list()
     if port_list is None:
         print(("Did not find any COM ports."))
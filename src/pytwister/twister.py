@@ -4,9 +4,58 @@
 #
 # SPDX-License-Identifier: BSD-3-Clause
 
+import logging
+import math
+import os
+import pathlib
 import typing
+import serial
 from . import arduino as pt
 
+logger = logging.getLogger(__name__)
+
+
+def _port_cache_path() -> pathlib.Path:
+    """
+    Returns the path of the file in which the port of the
+    last ArduinoPyTwister found is kept between processes.
+    Raises a RuntimeError if the home directory cannot be determined.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache"
+    return pathlib.Path(cache_home) / "pytwister" / "port"
+
+
+def _read_cached_port() -> typing.Optional[str]:
+    """
+    Returns the port stored in the cache file, or None if there is none.
+    """
+    try:
+        return _port_cache_path().read_text().strip() or None
+    except (OSError, RuntimeError):
+        return None
+
+
+def _write_cached_port(port: str) -> None:
+    """
+    Store the port in the cache file, ignoring failures.
+    """
+    try:
+        path = _port_cache_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(port)
+    except (OSError, RuntimeError) as exc:
+        logger.debug("Could not store port in the cache file: %s", exc)
+
+
+def _delete_cached_port() -> None:
+    """
+    Remove the cache file, ignoring failures.
+    """
+    try:
+        _port_cache_path().unlink()
+    except (OSError, RuntimeError) as exc:
+        logger.debug("Could not remove the cache file: %s", exc)
+
 
 class Twister:
     """
@@ -14,23 +63,100 @@ class Twister:
     relative degree commands.
     """
 
-    def __init__(self, dummy=False):
+    # Port of the last ArduinoPyTwister found, shared by all instances
+    _discovered_port: typing.Optional[str] = None
+
+    def __init__(self, dummy=False, low_latency=True):
         self.__dummy = dummy
         if not dummy:
             try:
-                port_list = pt.get_comport_list()
-                arduino_ports = pt.get_arduino_ports(port_list)
-                twister_port = pt.scan_list_for_arduinopytwister(arduino_ports)
-
-                self.ser = pt.get_serial_object_to_arduino(twister_port)
+                self.ser = self.__connect(low_latency)
             except Exception as exc:
                 raise RuntimeError("Could not connect to Arduino driver") from exc
         else:
             self.ser = None
-            print("Warning: dummy mode activated")
+            logger.warning("Dummy mode activated")
 
         self.angle = 0
         self.__step = pt.STEP_SIZE
+        self.__inv_step = 1.0 / pt.STEP_SIZE
+        self.__command_buffer = bytearray(pt.ROTATE_COMMAND_SIZE)
+
+    def __connect(self, low_latency: bool) -> serial.Serial:
+        """
+        Connect to the ArduinoPyTwister, trying first the port it was last
+        found on (by this or a previous process) before scanning all ports.
+        The remembered port is only tried if it is still listed as an Arduino
+        port, and is forgotten if the ArduinoPyTwister is not found there.
+
+        Parameters
+        ----------
+        low_latency : bool
+            Whether to enable the low latency mode of the serial port
+
+        Returns
+        -------
+        serial.Serial
+            The Serial object connected to the ArduinoPyTwister
+        """
+
+        port_list = pt.get_comport_list()
+        arduino_ports = pt.get_arduino_ports(port_list)
+
+        cached_port = Twister._discovered_port or _read_cached_port()
+        if cached_port is not None:
+            if arduino_ports is not None and cached_port in arduino_ports:
+                ser = self.__open_twister(cached_port, low_latency)
+                if ser is not None:
+                    Twister._discovered_port = cached_port
+                    return ser
+                logger.info("No ArduinoPyTwister on cached port %s", cached_port)
+            else:
+                logger.info("Cached port %s is no longer available", cached_port)
+            Twister._discovered_port = None
+            _delete_cached_port()
+
+        twister_port = pt.scan_list_for_arduinopytwister(
+            arduino_ports, low_latency=low_latency
+        )
+
+        ser = pt.get_serial_object_to_arduino(twister_port, low_latency=low_latency)
+        if twister_port is not None:
+            Twister._discovered_port = twister_port
+            _write_cached_port(twister_port)
+        return ser
+
+    def __open_twister(
+        self, port: str, low_latency: bool
+    ) -> typing.Optional[serial.Serial]:
+        """
+        Open the port and check that an ArduinoPyTwister is connected to it.
+
+        Parameters
+        ----------
+        port : str
+            The serial port to open
+        low_latency : bool
+            Whether to enable the low latency mode of the serial port
+
+        Returns
+        -------
+        typing.Optional[serial.Serial]
+            The Serial object connected to the ArduinoPyTwister, or None if
+            the port could not be opened or is connected to something else.
+        """
+
+        try:
+            ser = pt.get_serial_object_to_arduino(port, low_latency=low_latency)
+        except serial.SerialException:
+            return None
+        try:
+            if pt.check_arduino_is_twister_arduino(ser):
+                return ser
+        except serial.SerialException:
+            pass
+        ser.close()
+        return None
 
     def zero(self) -> None:
         """
@@ -53,11 +179,9 @@ class Twister:
         typing.Tuple[int, float]
             The corresponding number of steps, and the actual angle it generates.
         """
-        steps = degrees / self.__step
-        steps = int(steps)
-        degrees = steps * self.__step
+        steps = math.trunc(degrees * self.__inv_step)
 
-        return steps, degrees
+        return steps, steps * self.__step
 
     def rotate_rel(self, degrees: float) -> float:
         """
@@ -72,17 +196,67 @@ class Twister:
         -------
         float
             The angle of the twister after rotation
+
+        Raises
+        ------
+        RuntimeError
+            If the Arduino does not acknowledge the rotation in time or
+            reports an error, in which case the angle of the twister is left
+            unchanged
         """
 
         steps, degrees = self.__angle_to_steps(degrees)
         if self.__dummy:
-            print(f"Dummy: rotating the twister by {steps} steps")
+            logger.info("Dummy: rotating the twister by %s steps", steps)
         else:
-            pt.rotate_by_steps(self.ser, steps)
+            status_code = pt.rotate_by_steps(self.ser, steps, self.__command_buffer)
+            if status_code != pt.ACK:
+                raise RuntimeError(
+                    f"Arduino did not acknowledge the rotation: >{status_code}<."
+                )
         self.angle += degrees
 
         return self.angle
 
+    def rotate_batch(self, degrees_list: typing.Sequence[float]) -> float:
+        """
+        Rotate the twister successively by several relative angles in degrees,
+        sending the rotations to the Arduino in as few commands as possible.
+
+        Parameters
+        ----------
+        degrees_list : typing.Sequence[float]
+            The rotation angles, in order
+
+        Returns
+        -------
+        float
+            The angle of the twister after all rotations
+
+        Raises
+        ------
+        pytwister.arduino.BatchRotationError
+            If the Arduino does not acknowledge every rotation in time, in
+            which case the angle of the twister only includes the rotations
+            that were acknowledged
+        """
+
+        rotations = [self.__angle_to_steps(degrees) for degrees in degrees_list]
+        steps_list = [steps for steps, _ in rotations]
+        if self.__dummy:
+            logger.info("Dummy: rotating the twister by %s steps", steps_list)
+        else:
+            try:
+                pt.rotate_by_steps_batch(self.ser, steps_list)
+            except pt.BatchRotationError as exc:
+                for _, degrees in rotations[: exc.acknowledged]:
+                    self.angle += degrees
+                raise
+        for _, degrees in rotations:
+            self.angle += degrees
+
+        return self.angle
+
     def rotate_abs(self, degrees: float) -> float:
         """
         Rotate the twister to an absolute angle in degrees.
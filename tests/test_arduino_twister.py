@@ -4,9 +4,11 @@
 #
 # SPDX-License-Identifier: BSD-3-Clause
 
+import threading
 import unittest
 from unittest.mock import Mock
 from unittest.mock import patch
+import serial
 from pytwister import arduino as at
 
 
@@ -27,12 +29,137 @@ class TestArduinoTwister(unittest.TestCase):
             msg="Expected and computed rotation commands differ!",
         )
 
+    def test_assemble_rotate_command_into_buffer(self):
+        """
+        Test that the rotation command is assembled in
+        the provided buffer when there is one
+        """
+        command_buffer = bytearray(at.ROTATE_COMMAND_SIZE)
+        value_computed = at.assemble_rotate_command(200, command_buffer)
+        self.assertIs(command_buffer, value_computed)
+        self.assertEqual(
+            b"T\xc8\x00",
+            command_buffer,
+            msg="Expected and computed rotation commands differ!",
+        )
+
+    def test_assemble_rotate_command_negative_steps(self):
+        """
+        Test that steps are encoded as a little-endian signed integer
+        """
+        value_computed = at.assemble_rotate_command(-200)
+        value_expected = b"T\x38\xff"
+        self.assertEqual(
+            value_expected,
+            value_computed,
+            msg="Expected and computed rotation commands differ!",
+        )
+
+    def test_assemble_rotate_command_out_of_range(self):
+        """
+        Test that a number of steps that does not fit
+        in the command is rejected
+        """
+        with self.assertRaises(ValueError):
+            at.assemble_rotate_command(32768)
+
+    def test_rotate_by_steps(self):
+        """
+        Test that the rotation command is sent and the
+        status code sent back by the Arduino returned
+        """
+        ser = Mock()
+        ser.read = Mock(return_value=bytes([at.ACK]))
+        value_computed = at.rotate_by_steps(ser, 200)
+        ser.write.assert_called_once_with(b"T\xc8\x00")
+        self.assertEqual(
+            at.ACK, value_computed, msg="Expected and computed status codes differ!"
+        )
+
+    def test_rotate_by_steps_timeout(self):
+        """
+        Test that no status code is returned when the
+        Arduino does not answer
+        """
+        ser = Mock()
+        ser.read = Mock(return_value=b"")
+        value_computed = at.rotate_by_steps(ser, 200)
+        self.assertIsNone(value_computed, msg="Expected no status code!")
+
+    def test_assemble_batch_rotate_command(self):
+        """
+        Test the batch rotation command assembly function
+        """
+        value_computed = at.assemble_batch_rotate_command([1, -200])
+        value_expected = b"B\x02\x00\x01\x00\x38\xff"
+        self.assertEqual(
+            value_expected,
+            value_computed,
+            msg="Expected and computed batch rotation commands differ!",
+        )
+
+    def test_assemble_batch_rotate_command_too_large(self):
+        """
+        Test that batches that do not fit in the
+        Arduino receive buffer are rejected
+        """
+        with self.assertRaises(ValueError):
+            at.assemble_batch_rotate_command([1] * (at.MAX_BATCH_SIZE + 1))
+
+    def test_rotate_by_steps_batch(self):
+        """
+        Test that long sequences of rotations are split
+        into batches and that every rotation is acknowledged
+        """
+        ser = Mock()
+        ser.read = Mock(side_effect=lambda count: bytes(count))
+        steps_list = list(range(at.MAX_BATCH_SIZE + 5))
+        at.rotate_by_steps_batch(ser, steps_list)
+        self.assertEqual(ser.write.call_count, 2)
+        self.assertEqual(
+            [c.args[0] for c in ser.read.call_args_list], [at.MAX_BATCH_SIZE, 5]
+        )
+
+    def test_rotate_by_steps_batch_waits_for_all_status_codes(self):
+        """
+        Test that status codes arriving over several reads
+        are all collected before the next batch is sent
+        """
+        ser = Mock()
+        ser.read = Mock(side_effect=[b"\x00" * 25, b"", b"\x00" * 5, b"\x00"])
+        value_computed = at.rotate_by_steps_batch(ser, [1] * (at.MAX_BATCH_SIZE + 1))
+        self.assertEqual([at.ACK] * (at.MAX_BATCH_SIZE + 1), value_computed)
+        self.assertEqual(ser.write.call_count, 2)
+
+    @patch.object(at, "STOP_DURATION", 0)
+    @patch.object(at, "STEP_DURATION", 0)
+    @patch.object(at, "TIME_OUT", 0)
+    def test_rotate_by_steps_batch_timeout(self):
+        """
+        Test that rotations that are not acknowledged
+        in time raise an error
+        """
+        ser = Mock()
+        ser.read = Mock(return_value=b"")
+        with self.assertRaises(RuntimeError):
+            at.rotate_by_steps_batch(ser, [1, 1])
+
+    def test_rotate_by_steps_batch_error(self):
+        """
+        Test that a rotation answered with ERR raises an error
+        """
+        ser = Mock()
+        ser.read = Mock(return_value=bytes([at.ACK, at.ERR]))
+        with self.assertRaises(at.BatchRotationError) as context:
+            at.rotate_by_steps_batch(ser, [1, 1])
+        self.assertEqual(context.exception.acknowledged, 1)
+
     def test_get_arduino_firmware_name_some_name(self):
         """
         Test the function that gets the arduino firmware name
         """
         ser = Mock()
-        ser.readline = Mock(return_value=(("SomeFirmwareName\n").encode("utf-8")))
+        ser.read = Mock(side_effect=[b"\x10", b"SomeFirmwareName"])
         value_computed = at.get_arduino_firmware_name(ser)
         value_expected = "SomeFirmwareName"
         self.assertEqual(
@@ -44,13 +171,84 @@ class TestArduinoTwister(unittest.TestCase):
         Test the function that gets the arduino firmware name
         """
         ser = Mock()
-        ser.readline = Mock(return_value=b"")
+        ser.read = Mock(return_value=b"")
         value_computed = at.get_arduino_firmware_name(ser)
         value_expected = "No Arduino firmware name could be retrieved."
         self.assertEqual(
             value_expected, value_computed, msg="Expected and computed response differ!"
         )
 
+    def test_get_arduino_identity(self):
+        """
+        Test that firmware name and version are queried
+        with a single write.
+        """
+        ser = Mock()
+        ser.read = Mock(side_effect=[b"\x10", b"ArduinoPyTwister", b"\x03", b"0.3"])
+        value_computed = at.get_arduino_identity(ser)
+        value_expected = ("ArduinoPyTwister", "0.3")
+        self.assertEqual(
+            value_expected, value_computed, msg="Expected and computed response differ!"
+        )
+        ser.write.assert_called_once_with(b"FIRVER")
+
+    def test_check_arduino_is_twister_arduino_wrong_firmware(self):
+        """
+        Test that an Arduino with another firmware is rejected.
+        """
+        ser = Mock()
+        ser.read = Mock(side_effect=[b"\x10", b"SomeFirmwareName", b""])
+        value_computed = at.check_arduino_is_twister_arduino(ser)
+        self.assertFalse(value_computed, msg="Expected the Arduino to be rejected!")
+
+    def test_get_comport_list_is_cached(self):
+        """
+        Test that COM ports are enumerated once and the
+        enumeration reused until it expires.
+        """
+        at._comport_cache = None
+        port = Mock()
+        with patch("serial.tools.list_ports.comports", return_value=[port]) as comports:
+            self.assertEqual([port], at.get_comport_list())
+            self.assertEqual([port], at.get_comport_list())
+            self.assertEqual(comports.call_count, 1)
+            self.assertEqual([port], at.get_comport_list(max_age=0))
+            self.assertEqual(comports.call_count, 2)
+        at._comport_cache = None
+
+    def test_get_comport_list_without_ports(self):
+        """
+        Test that None is returned when there is no COM port.
+        """
+        at._comport_cache = None
+        with patch("serial.tools.list_ports.comports", return_value=[]):
+            value_computed = at.get_comport_list()
+        at._comport_cache = None
+        self.assertIsNone(value_computed, msg="Expected no COM port to be found!")
+
+    def test_check_arduino_is_twister_arduino_correct_firmware(self):
+        """
+        Test that an Arduino with a recent enough firmware is accepted.
+        """
+        ser = Mock()
+        ser.read = Mock(side_effect=[b"\x10", b"ArduinoPyTwister", b"\x03", b"1.0"])
+        value_computed = at.check_arduino_is_twister_arduino(ser)
+        self.assertTrue(value_computed, msg="Expected the Arduino to be accepted!")
+
+    def test_is_firmware_version_supported(self):
+        """
+        Test the firmware version requirement, including
+        replies that are not version numbers.
+        """
+        self.assertTrue(at.is_firmware_version_supported(at.MINIMUM_FIRMWARE_VERSION))
+        self.assertTrue(at.is_firmware_version_supported("10.0"))
+        self.assertFalse(at.is_firmware_version_supported("0.1"))
+        self.assertFalse(
+            at.is_firmware_version_supported(
+                "No Arduino firmware version could be retrieved."
+            )
+        )
+
     def test_get_arduino_ports_with_arduino_present(self):
         """
         Test the function get_arduino_ports when an
@@ -71,6 +269,29 @@ class TestArduinoTwister(unittest.TestCase):
             msg="Expected and computed Arduino port lists differ!",
         )
 
+    def test_get_arduino_ports_ranks_usb_ids_first(self):
+        """
+        Test the function get_arduino_ports when boards are
+        recognized by their USB ids or their description.
+        """
+        port1 = Mock(vid=None, pid=None)
+        port1.description = "USB2.0-Serial CH340"
+        port1.device = "device1"
+        port2 = Mock(vid=0x2341, pid=0x0043)
+        port2.description = "ttyACM0"
+        port2.device = "device2"
+        port3 = Mock(vid=0x1234, pid=0x5678)
+        port3.description = "Some port"
+        port3.device = "device3"
+        com_port_list = [port1, port2, port3]
+        value_computed = at.get_arduino_ports(com_port_list)
+        value_expected = [port2.device, port1.device]
+        self.assertEqual(
+            value_expected,
+            value_computed,
+            msg="Expected and computed Arduino port lists differ!",
+        )
+
     def test_get_arduino_ports_without_arduino_present(self):
         """
         Test the function get_arduino_ports when there is
@@ -96,7 +317,7 @@ class TestArduinoTwister(unittest.TestCase):
         Test the function that gets the arduino firmware version
         """
         ser = Mock()
-        ser.readline = Mock(return_value=(("0.2.3\n").encode("utf-8")))
+        ser.read = Mock(side_effect=[b"\x05", b"0.2.3"])
         value_computed = at.get_arduino_firmware_version(ser)
         value_expected = "0.2.3"
         self.assertEqual(
@@ -109,7 +330,7 @@ class TestArduinoTwister(unittest.TestCase):
         when the Arduino times out.
         """
         ser = Mock()
-        ser.readline = Mock(return_value=b"")
+        ser.read = Mock(return_value=b"")
         value_computed = at.get_arduino_firmware_version(ser)
         value_expected = "No Arduino firmware version could be retrieved."
         self.assertEqual(
@@ -132,6 +353,206 @@ class TestArduinoTwister(unittest.TestCase):
             value_expected, value_computed, msg="Expected and computed response differ!"
         )
 
+    def test_get_serial_object_to_arduino_ready(self):
+        """
+        Test that the Serial object is returned as soon as the
+        Arduino reports it is ready, with the regular read time out.
+        """
+        with patch("serial.Serial") as mock_serial:
+            ser = Mock()
+            ser.read = Mock(return_value=at.READY_CODE_B)
+            mock_serial.return_value = ser
+            value_computed = at.get_serial_object_to_arduino("dummyport")
+        self.assertEqual(
+            ser, value_computed, msg="Expected and computed response differ!"
+        )
+        ser.read.assert_called_once_with(1)
+        self.assertEqual(ser.timeout, at.TIME_OUT)
+
+    def test_get_serial_object_to_arduino_ignores_stray_bytes(self):
+        """
+        Test that bytes received before the ready code do not
+        cut the wait for the Arduino to initialize short.
+        """
+        with patch("serial.Serial") as mock_serial:
+            ser = Mock()
+            ser.read = Mock(side_effect=[b"\x00", b"\xf0", at.READY_CODE_B])
+            mock_serial.return_value = ser
+            value_computed = at.get_serial_object_to_arduino("dummyport")
+        self.assertEqual(
+            ser, value_computed, msg="Expected and computed response differ!"
+        )
+        self.assertEqual(ser.read.call_count, 3)
+        self.assertEqual(ser.timeout, at.TIME_OUT)
+
+    def test_set_low_latency_mode_supported(self):
+        """
+        Test that low latency mode is requested on the Serial object.
+        """
+        ser = Mock()
+        value_computed = at.set_low_latency_mode(ser)
+        ser.set_low_latency_mode.assert_called_once_with(True)
+        self.assertTrue(value_computed, msg="Expected low latency mode to be set!")
+
+    def test_set_low_latency_mode_unsupported(self):
+        """
+        Test that a port without low latency support is
+        reported as such rather than raising.
+        """
+        ser = Mock()
+        ser.set_low_latency_mode = Mock(side_effect=ValueError("not supported"))
+        value_computed = at.set_low_latency_mode(ser)
+        self.assertFalse(value_computed, msg="Expected low latency mode to fail!")
+
+    def test_set_low_latency_mode_not_implemented(self):
+        """
+        Test that platforms on which pyserial does not implement
+        low latency mode (macOS, BSD) are reported as unsupported.
+        """
+        ser = Mock()
+        ser.set_low_latency_mode = Mock(side_effect=NotImplementedError)
+        value_computed = at.set_low_latency_mode(ser)
+        self.assertFalse(value_computed, msg="Expected low latency mode to fail!")
+
+    @patch.object(at, "check_arduino_is_twister_arduino")
+    @patch.object(at, "get_serial_object_to_arduino")
+    def test_scan_list_for_arduinopytwister_with_twister_present(
+        self, get_serial_object, check_twister
+    ):
+        """
+        Test that the concurrent port scan returns the port
+        connected to an ArduinoPyTwister and closes all probed ports.
+        """
+        serials = {port: Mock(port=port) for port in ["port1", "port2", "port3"]}
+        get_serial_object.side_effect = lambda port, **_: serials[port]
+        check_twister.side_effect = lambda ser: ser.port == "port2"
+        value_computed = at.scan_list_for_arduinopytwister(list(serials))
+        value_expected = "port2"
+        self.assertEqual(
+            value_expected, value_computed, msg="Expected and computed ports differ!"
+        )
+        serials["port2"].close.assert_called_once()
+
+    @patch.object(at, "check_arduino_is_twister_arduino", return_value=False)
+    @patch.object(at, "get_serial_object_to_arduino")
+    def test_scan_list_for_arduinopytwister_without_twister_present(
+        self, get_serial_object, check_twister
+    ):
+        """
+        Test that the concurrent port scan returns None
+        when no ArduinoPyTwister is connected.
+        """
+        serials = {port: Mock(port=port) for port in ["port1", "port2"]}
+        get_serial_object.side_effect = lambda port, **_: serials[port]
+        value_computed = at.scan_list_for_arduinopytwister(list(serials))
+        self.assertIsNone(value_computed, msg="Expected no port to be found!")
+        for ser in serials.values():
+            ser.close.assert_called_once()
+
+    @patch.object(at, "check_arduino_is_twister_arduino")
+    @patch.object(at, "get_serial_object_to_arduino")
+    def test_scan_list_for_arduinopytwister_skips_unavailable_port(
+        self, get_serial_object, check_twister
+    ):
+        """
+        Test that a port that cannot be written to does
+        not prevent the twister from being found.
+        """
+        serials = {port: Mock(port=port) for port in ["port1", "port2"]}
+        serials["port1"].write = Mock(side_effect=serial.SerialTimeoutException)
+        get_serial_object.side_effect = lambda port, **_: serials[port]
+        check_twister.side_effect = lambda ser: ser.write(b"") or True
+        value_computed = at.scan_list_for_arduinopytwister(list(serials))
+        value_expected = "port2"
+        self.assertEqual(
+            value_expected, value_computed, msg="Expected and computed ports differ!"
+        )
+
+    @patch.object(at, "check_arduino_is_twister_arduino")
+    @patch.object(at, "get_serial_object_to_arduino")
+    def test_scan_list_for_arduinopytwister_skips_unreadable_port(
+        self, get_serial_object, check_twister
+    ):
+        """
+        Test that a port failing on read does not prevent
+        the twister from being found.
+        """
+        serials = {port: Mock(port=port) for port in ["port1", "port2"]}
+        serials["port1"].read = Mock(
+            side_effect=serial.SerialException(
+                "device reports readiness to read but returned no data"
+            )
+        )
+        get_serial_object.side_effect = lambda port, **_: serials[port]
+        check_twister.side_effect = lambda ser: ser.read(1) or True
+        value_computed = at.scan_list_for_arduinopytwister(list(serials))
+        value_expected = "port2"
+        self.assertEqual(
+            value_expected, value_computed, msg="Expected and computed ports differ!"
+        )
+
+    @patch.object(at, "check_arduino_is_twister_arduino")
+    @patch.object(at, "get_serial_object_to_arduino")
+    def test_scan_list_for_arduinopytwister_interrupts_other_probes(
+        self, get_serial_object, check_twister
+    ):
+        """
+        Test that probes still running when the twister is
+        found are interrupted and close their port.
+        """
+        serials = {port: Mock(port=port) for port in ["port1", "port2"]}
+        get_serial_object.side_effect = lambda port, **_: serials[port]
+        probing_port1 = threading.Event()
+        interrupted = threading.Event()
+        closed = threading.Event()
+        serials["port1"].cancel_read = Mock(side_effect=interrupted.set)
+        serials["port1"].close = Mock(side_effect=closed.set)
+
+        def check(ser):
+            if ser.port == "port1":
+                probing_port1.set()
+                interrupted.wait(timeout=5)
+                return False
+            probing_port1.wait(timeout=5)
+            return True
+
+        check_twister.side_effect = check
+        value_computed = at.scan_list_for_arduinopytwister(list(serials))
+        value_expected = "port2"
+        self.assertEqual(
+            value_expected, value_computed, msg="Expected and computed ports differ!"
+        )
+        self.assertTrue(closed.wait(timeout=5), msg="Expected port1 to be closed!")
+        self.assertEqual(serials["port1"].timeout, 0)
+
+    @patch.object(at, "check_arduino_is_twister_arduino", return_value=True)
+    @patch.object(at, "get_serial_object_to_arduino")
+    def test_scan_list_for_arduinopytwister_low_latency_opt_out(
+        self, get_serial_object, check_twister
+    ):
+        """
+        Test that probed ports are not put in low latency
+        mode when it is not requested.
+        """
+        at.scan_list_for_arduinopytwister(["port1"], low_latency=False)
+        get_serial_object.assert_called_once_with("port1", low_latency=False)
+
+    @patch.object(at, "PORT_DISCOVERY_TIMEOUT", 0.01)
+    @patch.object(at, "check_arduino_is_twister_arduino")
+    @patch.object(at, "get_serial_object_to_arduino")
+    def test_scan_list_for_arduinopytwister_timeout(
+        self, get_serial_object, check_twister
+    ):
+        """
+        Test that ports which do not answer within the
+        discovery time out are skipped.
+        """
+        release = threading.Event()
+        check_twister.side_effect = lambda ser: release.wait()
+        value_computed = at.scan_list_for_arduinopytwister(["port1"])
+        release.set()
+        self.assertIsNone(value_computed, msg="Expected no port to be found!")
+
 
 if __name__ == "__main__":
     unittest.main()
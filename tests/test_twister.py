@@ -4,8 +4,13 @@
 #
 # SPDX-License-Identifier: BSD-3-Clause
 
+import os
+import tempfile
 import unittest
+from unittest.mock import Mock
+from unittest.mock import patch
 from pytwister import Twister
+from pytwister import arduino as pt
 
 
 class TestTwister(unittest.TestCase):
@@ -39,12 +44,108 @@ class TestTwister(unittest.TestCase):
         self.assert_angle(-90, self.twister.rotate_rel(-180))
         self.assert_angle(360, self.twister.rotate_rel(450))
 
+    def test_rotate_rel_truncates_to_steps(self):
+        self.twister.zero()
+
+        self.assert_angle(0.225, self.twister.rotate_rel(0.4))
+        self.assert_angle(0, self.twister.rotate_rel(-0.3))
+
     def test_rotate_abs(self):
         self.assert_angle(90, self.twister.rotate_abs(90))
         self.assert_angle(-180, self.twister.rotate_abs(-180))
         self.assert_angle(360, self.twister.rotate_abs(360))
         self.assert_angle(0, self.twister.rotate_abs(0))
 
+    def test_rotate_batch(self):
+        self.twister.zero()
+
+        self.assert_angle(360, self.twister.rotate_batch([90, -180, 450]))
+
+    def test_rotate_rel_not_acknowledged(self):
+        for reply in [b"", bytes([pt.ERR])]:
+            ser = Mock()
+            ser.read = Mock(return_value=reply)
+            with patch.object(Twister, "_Twister__connect", return_value=ser):
+                twister = Twister()
+            with self.assertRaises(RuntimeError):
+                twister.rotate_rel(90)
+            self.assert_angle(0, twister.angle)
+
+    @patch.object(pt, "STOP_DURATION", 0)
+    @patch.object(pt, "STEP_DURATION", 0)
+    @patch.object(pt, "TIME_OUT", 0)
+    def test_rotate_batch_partially_acknowledged(self):
+        ser = Mock()
+        # The first batch is acknowledged, the second one only in part
+        replies = iter([bytes(pt.MAX_BATCH_SIZE), bytes(2)])
+        ser.read = Mock(side_effect=lambda count: next(replies, b""))
+        with patch.object(Twister, "_Twister__connect", return_value=ser):
+            twister = Twister()
+        with self.assertRaises(pt.BatchRotationError):
+            twister.rotate_batch([0.225] * (pt.MAX_BATCH_SIZE + 5))
+        self.assert_angle(
+            round(0.225 * (pt.MAX_BATCH_SIZE + 2), 9), round(twister.angle, 9)
+        )
+
+
+@patch.object(pt, "check_arduino_is_twister_arduino", return_value=True)
+@patch.object(pt, "get_serial_object_to_arduino", side_effect=lambda port, **_: Mock())
+@patch.object(pt, "scan_list_for_arduinopytwister", return_value="port1")
+@patch.object(pt, "get_arduino_ports", return_value=["port1"])
+@patch.object(pt, "get_comport_list", return_value=[Mock()])
+class TestTwisterDiscovery(unittest.TestCase):
+    """
+    A test class for the reuse of the discovered Arduino port
+    """
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.environ = patch.dict(os.environ, {"XDG_CACHE_HOME": self.cache_dir.name})
+        self.environ.start()
+        Twister._discovered_port = None
+
+    def tearDown(self):
+        Twister._discovered_port = None
+        self.environ.stop()
+        self.cache_dir.cleanup()
+
+    def test_discovered_port_is_reused(self, comports, ports, scan, open_port, check):
+        Twister()
+        Twister()
+        self.assertEqual(scan.call_count, 1)
+        self.assertEqual(Twister._discovered_port, "port1")
+
+        Twister._discovered_port = None
+        Twister()
+        self.assertEqual(scan.call_count, 1, msg="Cache file was not used")
+
+    def test_stale_port_is_rediscovered(self, comports, ports, scan, open_port, check):
+        ports.return_value = ["port0", "port1"]
+        Twister._discovered_port = "port0"
+        check.return_value = False
+        Twister()
+        self.assertEqual(scan.call_count, 1)
+        self.assertEqual(Twister._discovered_port, "port1")
+
+    def test_missing_cached_port_is_not_opened(
+        self, comports, ports, scan, open_port, check
+    ):
+        cache_file = os.path.join(self.cache_dir.name, "pytwister", "port")
+        os.makedirs(os.path.dirname(cache_file))
+        with open(cache_file, "w") as f:
+            f.write("port9")
+        Twister()
+        self.assertNotIn("port9", [c.args[0] for c in open_port.call_args_list])
+        self.assertEqual(scan.call_count, 1)
+        with open(cache_file) as f:
+            self.assertEqual(f.read(), "port1")
+
+    def test_unknown_home_directory(self, comports, ports, scan, open_port, check):
+        del os.environ["XDG_CACHE_HOME"]
+        with patch("pathlib.Path.home", side_effect=RuntimeError):
+            Twister()
+        self.assertEqual(Twister._discovered_port, "port1")
+
 
 if __name__ == "__main__":
     unittest.main()